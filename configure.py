@@ -4,18 +4,26 @@ creates build files for ninja.
 """
 #! /usr/bin/env python3
 import argparse
+import io
 import os
 import shutil
+import subprocess
 import sys
 import json
 import re
+import hashlib
+import pickle
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Set, Union
+from typing import Dict, List, NamedTuple, Set, Union
 
 import ninja_syntax
-import splat
-import splat.scripts.split as split
-from splat.segtypes.linker_entry import LinkerEntry
+
+# orjson is optional, but much faster than json for large configs
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Constants
 ROOT      = Path(__file__).parent.resolve()
@@ -30,6 +38,12 @@ LD_PATH      = f"{LINK_DIR}/{BASENAME}.ld"
 ELF_PATH     = f"{OUT_DIR}/{BASENAME}"
 MAP_PATH     = f"{OUT_DIR}/{BASENAME}.map"
 PRE_ELF_PATH = f"{OUT_DIR}/{BASENAME}.elf"
+SYM_PATH     = Path(f"{CONFIG_PATH}/sym.txt")
+ROM_PATH     = Path(f"elf/{BASENAME}")
+CACHE_DIR    = Path(".configure_cache")
+
+# Set to any non-empty value to always run splat instead of using the split cache
+NO_CACHE_ENV = "DOGCOMP_NO_CACHE"
 
 # Compilation Flags
 INCLUDE_PATHS        = "-Iinclude"
@@ -45,15 +59,85 @@ COMPILE_CMD_CPP = (
     f"{CC_DIR}/ee-gcc.exe -c {INCLUDE_PATHS} {COMPILER_FLAGS_CPP}"
 )
 
+# How long the wineserver started by configure stays around once idle, in seconds
+WINESERVER_TIMEOUT = 86400
+
 if sys.platform == "linux" or sys.platform == "linux2":
-    COMPILE_CMD_C = f"wine {COMPILE_CMD_C}"
-    COMPILE_CMD_CPP = f"wine {COMPILE_CMD_CPP}"
+    COMPILE_CMD_C = f"WINEDEBUG=-all wine {COMPILE_CMD_C}"
+    COMPILE_CMD_CPP = f"WINEDEBUG=-all wine {COMPILE_CMD_CPP}"
+
+# Ninja rule commands
+CROSS = "mips-linux-gnu-"
+
+# Objects are only replaced when their contents change, which lets restat
+# skip relinking when a rebuild produces the same object
+UPDATE_OUT = "{ cmp -s $out.tmp $out && rm $out.tmp || mv $out.tmp $out; }"
+
+# Objects from the old compiler are rewritten by binutils' strip before the
+# link or objdiff sees them, so this has to run for every compiled object
+STRIP_OUT = f"{CROSS}strip $out.tmp -N dummy-symbol-name"
+
+LD_ARGS = f"-EL -T {LINK_DIR}/undefined_syms_auto.txt -T {LINK_DIR}/undefined_funcs_auto.txt -Map $mapfile -T $in -o $out"
 
+AS_CMD      = f"cpp {INCLUDE_PATHS} $in -o  - | {CROSS}as -no-pad-sections -EL -march=5900 -mabi=eabi -Iinclude -o $out.tmp && {UPDATE_OUT}"
+CC_CMD      = f"{COMPILE_CMD_C} $cflags $in -o $out.tmp && {STRIP_OUT} && {UPDATE_OUT}"
+CPP_CMD     = f"{COMPILE_CMD_CPP} $cflags $in -o $out.tmp && {STRIP_OUT} && {UPDATE_OUT}"
+LD_CMD      = f"{CROSS}ld {LD_ARGS}"
+SHA1SUM_CMD = "sha1sum -c $in && touch $out"
+ELF_CMD     = f"{CROSS}objcopy $in $out -O binary"
+COPY_CMD    = "cp $in $out"
+
+
+# Path segments swapped to get the base object of objdiff units with sources
+TARGET_SEGMENT   = f"{os.sep}target{os.sep}"
+BASE_OBJ_SEGMENT = f"{os.sep}build{os.sep}obj{os.sep}src{os.sep}"
 
 CATEGORY_MAP = {
     "game": "Main",
     "data": "Data"
 }
+PROGRESS_CATEGORIES = [{"id": id, "name": name} for id, name in CATEGORY_MAP.items()]
+
+class BuildEntry(NamedTuple):
+    """
+    The parts of a splat linker entry needed to write the build. These only hold
+    plain values, so cached entries load without importing splat.
+    """
+    seg_type: str
+    rule: Union[str, None]
+    object_path: Union[Path, None]
+    src_paths: List[Path]
+
+# Build rule of each segment type, filled in as new types are seen
+SEGMENT_RULES: Dict[type, Union[str, None]] = {}
+
+def segment_rule(seg) -> Union[str, None]:
+    """
+    Get the build rule for a segment, or None if its type can't be built.
+    """
+    seg_type = type(seg)
+    if seg_type not in SEGMENT_RULES:
+        from splat.segtypes.common import asm, bin, c, cpp, data, databin, rodatabin, textbin
+
+        # Segment types assembled with the as rule, including their subclasses
+        as_segment_types = (
+            asm.CommonSegAsm,
+            data.CommonSegData,
+            databin.CommonSegDatabin,
+            rodatabin.CommonSegRodatabin,
+            textbin.CommonSegTextbin,
+            bin.CommonSegBin,
+        )
+
+        if seg_type is cpp.CommonSegCpp:
+            SEGMENT_RULES[seg_type] = "cpp"
+        elif seg_type is c.CommonSegC:
+            SEGMENT_RULES[seg_type] = "cc"
+        elif issubclass(seg_type, as_segment_types):
+            SEGMENT_RULES[seg_type] = "as"
+        else:
+            SEGMENT_RULES[seg_type] = None
+    return SEGMENT_RULES[seg_type]
 
 def clean():
     """
@@ -67,28 +151,175 @@ def clean():
         LD_PATH
     ]
     for filename in files_to_clean:
-        if os.path.exists(filename):
-            os.remove(filename)
+        Path(filename).unlink(missing_ok=True)
 
-    shutil.rmtree("asm", ignore_errors=True)
-    shutil.rmtree(LINK_DIR, ignore_errors=True)
-    shutil.rmtree("target", ignore_errors=True)
-    shutil.rmtree(OUT_DIR, ignore_errors=True)
+    # The trees don't overlap, so they can be removed side by side; the
+    # deletions are syscall bound and release the GIL
+    dirs_to_clean = ["asm", LINK_DIR, "target", OUT_DIR, CACHE_DIR]
+    with ThreadPoolExecutor(max_workers=len(dirs_to_clean)) as executor:
+        futures = [executor.submit(shutil.rmtree, d, ignore_errors=True) for d in dirs_to_clean]
+        for future in futures:
+            future.result()
+
+
+#MARK: Split
+def split_cache_key() -> str:
+    """
+    Hash the splat version, its config, symbol and ELF inputs, the stat info
+    of the C/C++ sources it scans for the split, and this script itself.
+    """
+    from importlib import metadata
+
+    # Read the version from the package metadata, importing splat is slow
+    try:
+        splat_version = metadata.version("splat64")
+    except metadata.PackageNotFoundError:
+        import splat
+        splat_version = splat.__version__
+
+    # The script decides the segment rules stored in the cache and which asm
+    # gets its short loops rewritten, so any edit to it needs a new split
+    digest = hashlib.blake2b(splat_version.encode())
+    for path in (Path(__file__), YAML_FILE, SYM_PATH, ROM_PATH):
+        # A missing input is left for splat to report
+        if path.exists():
+            digest.update(path.read_bytes())
+
+    # Splat scans the C/C++ sources for INCLUDE_ASM and defined functions, which
+    # decides the asm files and undefined symbols it writes
+    sources = []
+    for dirpath, _, files in os.walk("src"):
+        for name in files:
+            if name.endswith((".c", ".cpp")):
+                path = os.path.join(dirpath, name)
+                st = os.stat(path)
+                sources.append(f"{path} {st.st_mtime_ns} {st.st_size}")
+    digest.update("\n".join(sorted(sources)).encode())
+    return digest.hexdigest()
+
+
+def run_split():
+    """
+    Split the binary with splat and return the build entries, the asm path and
+    the cache file to save them to, which is None if they came from the cache.
+    The split is skipped while its inputs are unchanged.
+    """
+    cache_file = CACHE_DIR / f"split_{split_cache_key()}.pkl"
+
+    # The split files on disk must still be there to reuse the cached result
+    use_cache = not os.environ.get(NO_CACHE_ENV)
+    if use_cache and cache_file.exists() and os.path.exists(LD_PATH):
+        try:
+            with cache_file.open("rb") as f:
+                entries, asm_path = pickle.load(f)
+        except (pickle.UnpicklingError, EOFError):
+            pass
+        else:
+            if os.path.isdir(asm_path):
+                return entries, asm_path, None
+
+    # Make splat parse the YAML config with the libyaml bindings when available.
+    # pylibyaml swaps them in on import, otherwise replace the loaders by hand
+    try:
+        import pylibyaml  # noqa: F401
+    except ImportError:
+        import yaml
+        if yaml.__with_libyaml__:
+            yaml.SafeLoader = yaml.CSafeLoader
+            yaml.Loader = yaml.CLoader
+
+    import splat.scripts.split as split
+
+    split.main([YAML_FILE], modes="all", verbose=False)
+    entries = [
+        BuildEntry(entry.segment.type, segment_rule(entry.segment), entry.object_path, entry.src_paths)
+        for entry in split.linker_writer.entries
+    ]
+    return entries, split.config["options"]["asm_path"], cache_file
+
+
+def save_split_cache(cache_file: Path, entries: List[BuildEntry], asm_path: str) -> None:
+    """
+    Cache a split result, replacing the result of any earlier split.
+    """
+    CACHE_DIR.mkdir(exist_ok=True)
+    for old_file in CACHE_DIR.glob("split_*.pkl"):
+        old_file.unlink()
+    with cache_file.open("wb") as f:
+        pickle.dump((entries, asm_path), f)
+
+
+def write_if_changed(path: Path, text: str) -> None:
+    """
+    Write a generated file, skipping the write if it would be unchanged.
+    The hash of the last written text is kept next to the split cache.
+    """
+    data = text.encode("utf-8")
+    hash_file = CACHE_DIR / f"{path.name}.hash"
+
+    # Store the mtime as well, so a file edited or replaced by hand gets rewritten
+    digest = hashlib.blake2b(data).hexdigest()
+    if path.exists() and hash_file.exists():
+        if hash_file.read_text() == f"{digest} {path.stat().st_mtime_ns}":
+            return
+
+    path.write_bytes(data)
+    CACHE_DIR.mkdir(exist_ok=True)
+    hash_file.write_text(f"{digest} {path.stat().st_mtime_ns}")
+
+
+def start_wineserver():
+    """
+    Start a persistent wineserver so the compiles don't each have to start one.
+    """
+    if not (sys.platform == "linux" or sys.platform == "linux2"):
+        return
+
+    wineserver = shutil.which("wineserver")
+    if wineserver is None:
+        return
+
+    # Exits on its own if a wineserver is already running
+    subprocess.Popen(
+        [wineserver, "-p", str(WINESERVER_TIMEOUT)],
+        env={**os.environ, "WINEDEBUG": "-all"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def json_dumps(obj) -> bytes:
+    """
+    Serialize an object as JSON indented by two spaces.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2).encode("utf-8")
 
 
 #MARK: Build
-def build_stuff(linker_entries: List[LinkerEntry], skip_checksum=False, objects_only=False, dual_objects=False):
+def build_stuff(linker_entries: List[BuildEntry], skip_checksum=False, objects_only=False, dual_objects=False):
     """
     Build the objects and the final ELF file.
     If objects_only is True, only build objects and skip linking/checksum.
     If dual_objects is True, build objects twice: once normally, once with -DSKIP_ASM.
     """
-    built_objects: Set[Path] = set()
+    built_objects: List[str] = []
     objdiff_units = []  # For objdiff.json
 
+    # Stems of the C/C++ files in src/, indexed once for the objdiff units
+    src_stems: Set[str] = set()
+    if dual_objects:
+        for _, _, files in os.walk("src"):
+            for filename in files:
+                stem, ext = os.path.splitext(filename)
+                if ext in (".c", ".cpp"):
+                    src_stems.add(stem)
+
     def build(
-        object_paths: Union[Path, List[Path]],
-        src_paths: List[Path],
+        object_path: Path,
+        src_paths: List[str],
         task: str,
         variables: Dict[str, str] = None,
         implicit_outputs: List[str] = None,
@@ -107,197 +338,161 @@ def build_stuff(linker_entries: List[LinkerEntry], skip_checksum=False, objects_
         if implicit_outputs is None:
             implicit_outputs = []
 
-        # Convert object_paths to list if it is not already
-        if not isinstance(object_paths, list):
-            object_paths = [object_paths]
+        # Add extra_flags to variables if present, the common case without
+        # any variables passes None so nothing needs to be copied
+        if extra_flags:
+            build_vars = {**variables, "cflags": extra_flags}
+        else:
+            build_vars = variables or None
+
+        obj_str = os.fspath(object_path)
 
         # Only rewrite output path to .o if out_dir is set (i.e. --objects mode)
         if out_dir:
-            new_object_paths = []
-            for obj in object_paths:
-                obj = Path(obj)
-                stem = obj.stem
-                if obj.suffix in [".s", ".c"]:
-                    stem = obj.stem
-                else:
-                    if obj.suffix == ".o" and obj.with_suffix("").suffix in [".s", ".c"]:
-                        stem = obj.with_suffix("").stem
-                target_dir = out_dir if out_dir else obj.parent
-                new_obj = Path(target_dir) / (stem + ".o")
-                new_object_paths.append(new_obj)
-            obj_path = str(object_paths[0])
-            object_paths = new_object_paths
-
-        # Otherwise, use the original object_paths (with .s.o, .c.o, etc.)
-
-        # Add object paths to built_objects
-        for idx, object_path in enumerate(object_paths):
-            if object_path.suffix == ".o":
-                built_objects.add(object_path)
-
-            # Add extra_flags to variables if present
-            build_vars = variables.copy()
-            if extra_flags:
-                build_vars["cflags"] = extra_flags
-            ninja.build(
-                outputs=[str(object_path)],
-                rule=task,
-                inputs=[str(s) for s in src_paths],
-                variables=build_vars,
-                implicit_outputs=implicit_outputs,
-            )
-
-            # Collect for objdiff.json if requested
-            if collect_objdiff and orig_entry is not None:
-                src = src_paths[0] if src_paths else None
-                if src:
-                    src = Path(src)
-                    # Always use the final "matched" name, i.e. as if it will be in src/ with no asm/ prefix
-                    try:
-                        # If the file is in asm/, replace asm/ with nothing (just drop asm/)
-                        if src.parts[0] == "asm":
-                            rel = Path(*src.parts[1:])
-                        elif src.parts[0] == "src":
-                            rel = Path(*src.parts[1:])
-                        else:
-                            rel = src
-                        # Remove extension for the name
-                        name = str(rel.with_suffix(""))
-                    except Exception:
-                        name = str(src.with_suffix(""))
-                else:
-                    name = object_path.stem
-                    # Ensure `rel` is defined so later code can compute src-based paths
-                    try:
-                        rel = Path(object_path)
-                    except Exception:
-                        rel = Path(str(object_path))
-
-                if "target" in str(object_path):
-                    target_path = str(object_path)
-
-                    # Determine if a .c or .cpp file exists in src/ for this unit (recursively)
-                    src_base = rel.with_suffix("")
-                    src_c_files = list(Path("src").rglob(src_base.name + ".c"))
-                    src_cpp_files = list(Path("src").rglob(src_base.name + ".cpp"))
-                    has_src = bool(src_c_files or src_cpp_files)
-
-                    # Determine the category based on the path
-                    if "src/" in str(orig_entry.src_paths[idx]):
-                        categories = ["game"]
-                    elif "asm/data" in str(orig_entry.src_paths[idx]):
-                        categories = ["data"]
-
-                    unit = {
-                        "name": name,
-                        "base_path": obj_path,
-                        "target_path": target_path,
-                        "metadata": {
-                            "progress_categories": categories,
-                        }
+            stem, suffix = os.path.splitext(os.path.basename(obj_str))
+            if suffix == ".o":
+                inner_stem, inner_suffix = os.path.splitext(stem)
+                if inner_suffix in [".s", ".c"]:
+                    stem = inner_stem
+            obj_path = obj_str
+            obj_str = os.path.join(out_dir, stem + ".o")
+
+        # Otherwise, use the original object_path (with .s.o, .c.o, etc.)
+
+        # Add object path to built_objects
+        if obj_str.endswith(".o"):
+            built_objects.append(obj_str)
+        ninja.build(
+            outputs=[obj_str],
+            rule=task,
+            inputs=src_paths,
+            variables=build_vars,
+            implicit_outputs=implicit_outputs,
+        )
+
+        # Collect for objdiff.json if requested
+        if collect_objdiff and orig_entry is not None:
+            src = src_paths[0] if src_paths else None
+            if src:
+                # Always use the final "matched" name, i.e. as if it will be in src/ with no asm/ prefix
+                if src.startswith(("asm" + os.sep, "src" + os.sep)):
+                    src = src[4:]
+                # Remove extension for the name
+                name = os.path.splitext(src)[0]
+            else:
+                name = os.path.splitext(os.path.basename(obj_str))[0]
+
+            if "target" in obj_str:
+                target_path = obj_str
+
+                # Determine if a .c or .cpp file exists in src/ for this unit (recursively)
+                has_src = os.path.basename(name) in src_stems
+
+                # Determine the category based on the path
+                orig_src_str = os.fspath(orig_entry.src_paths[0])
+                if "src/" in orig_src_str:
+                    categories = ["game"]
+                elif "asm/data" in orig_src_str:
+                    categories = ["data"]
+
+                unit = {
+                    "name": name,
+                    "base_path": obj_path,
+                    "target_path": target_path,
+                    "metadata": {
+                        "progress_categories": categories,
                     }
+                }
 
-                    if has_src:
-                        # Replace only the path segment named 'target' with 'build/obj/src',
-                        # preserving any filenames that may contain the substring "target".
-                        op = Path(object_path)
-                        parts = list(op.parts)
-                        for idx, part in enumerate(parts):
-                            if part == "target":
-                                parts[idx] = "build/obj/src"
-                                break
-                        base_path = str(Path(*parts))
-                        unit["base_path"] = base_path
-                    objdiff_units.append(unit)
-
-    ninja = ninja_syntax.Writer(open(str(ROOT / "build.ninja"), "w", encoding="utf-8"), width=9999)
+                if has_src:
+                    # Replace only the path segment named 'target' with 'build/obj/src',
+                    # preserving any filenames that may contain the substring "target".
+                    # The leading separator lets a leading 'target' segment match too.
+                    base_path = f"{os.sep}{obj_str}".replace(TARGET_SEGMENT, BASE_OBJ_SEGMENT, 1)[1:]
+                    unit["base_path"] = base_path
+                objdiff_units.append(unit)
 
-    #MARK: Rules
-    cross = "mips-linux-gnu-"
+        return obj_str
 
-    ld_args = f"-EL -T {LINK_DIR}/undefined_syms_auto.txt -T {LINK_DIR}/undefined_funcs_auto.txt -Map $mapfile -T $in -o $out"
+    # Buffer the whole ninja file in memory and write it out in one go
+    ninja_buffer = io.StringIO()
+    ninja = ninja_syntax.Writer(ninja_buffer, width=9999)
 
+    #MARK: Rules
     ninja.rule(
         "as",
         description="as $in",
-        command=f"cpp {INCLUDE_PATHS} $in -o  - | {cross}as -no-pad-sections -EL -march=5900 -mabi=eabi -Iinclude -o $out",
+        command=AS_CMD,
+        restat=True,
     )
 
     ninja.rule(
         "cc",
         description="cc $in",
-        command=f"{COMPILE_CMD_C} $cflags $in -o $out && {cross}strip $out -N dummy-symbol-name",
+        command=CC_CMD,
+        restat=True,
     )
 
     ninja.rule(
         "cpp",
         description="cpp $in",
-        command=f"{COMPILE_CMD_CPP} $cflags $in -o $out && {cross}strip $out -N dummy-symbol-name",
+        command=CPP_CMD,
+        restat=True,
+    )
+
+    ninja.rule(
+        "copy",
+        description="copy $out",
+        command=COPY_CMD,
     )
 
     ninja.rule(
         "ld",
         description="link $out",
-        command=f"{cross}ld {ld_args}",
+        command=LD_CMD,
     )
 
     ninja.rule(
         "sha1sum",
         description="sha1sum $in",
-        command="sha1sum -c $in && touch $out",
+        command=SHA1SUM_CMD,
     )
 
     ninja.rule(
         "elf",
         description="elf $out",
-        command=f"{cross}objcopy $in $out -O binary",
+        command=ELF_CMD,
     )
 
     TARGET_DIR = f"target"
 
     # Build all the objects
     for entry in linker_entries:
-        seg = entry.segment
-
-        if seg.type[0] == ".":
+        if entry.seg_type[0] == ".":
             continue
 
         if entry.object_path is None:
             continue
         
-        if dual_objects == False:
-            if isinstance(seg, splat.segtypes.common.asm.CommonSegAsm) or isinstance(
-            seg, splat.segtypes.common.data.CommonSegData) or isinstance(
-            seg, splat.segtypes.common.databin.CommonSegDatabin) or isinstance(
-            seg, splat.segtypes.common.rodatabin.CommonSegRodatabin) or isinstance(
-            seg, splat.segtypes.common.textbin.CommonSegTextbin) or isinstance(
-            seg, splat.segtypes.common.bin.CommonSegBin):
-                build(entry.object_path, entry.src_paths, "as")
-            elif type(seg) == splat.segtypes.common.cpp.CommonSegCpp:
-                build(entry.object_path, entry.src_paths, "cpp")
-            elif type(seg) == splat.segtypes.common.c.CommonSegC:
-                build(entry.object_path, entry.src_paths, "cc")
+        if entry.rule is None:
+            print(f"ERROR: Unsupported build segment type {entry.seg_type}")
+            sys.exit(1)
+
+        # Stringify the sources once, both dual builds share them
+        str_srcs = [os.fspath(s) for s in entry.src_paths]
+
+        # With dual objects, build the objdiff target and then the base object
+        if dual_objects:
+            target_obj = build(entry.object_path, str_srcs, entry.rule, out_dir=TARGET_DIR, collect_objdiff=True, orig_entry=entry)
+
+            # The assembler never sees $cflags, so building with SKIP_ASM would
+            # only produce the same object a second time
+            if entry.rule == "as":
+                build(entry.object_path, [target_obj], "copy")
             else:
-                print(f"ERROR: Unsupported build segment type {seg.type}")
-                sys.exit(1)
+                build(entry.object_path, str_srcs, entry.rule, extra_flags="-DSKIP_ASM", orig_entry=entry)
         else:
-            if isinstance(seg, splat.segtypes.common.asm.CommonSegAsm) or isinstance(
-            seg, splat.segtypes.common.data.CommonSegData) or isinstance(
-            seg, splat.segtypes.common.databin.CommonSegDatabin) or isinstance(
-            seg, splat.segtypes.common.rodatabin.CommonSegRodatabin) or isinstance(
-            seg, splat.segtypes.common.textbin.CommonSegTextbin) or isinstance(
-            seg, splat.segtypes.common.bin.CommonSegBin):
-                build(entry.object_path, entry.src_paths, "as", out_dir=TARGET_DIR, collect_objdiff=True, orig_entry=entry)
-                build(entry.object_path, entry.src_paths, "as", extra_flags="-DSKIP_ASM")
-            elif type(seg) == splat.segtypes.common.cpp.CommonSegCpp:
-                build(entry.object_path, entry.src_paths, "cpp", out_dir=TARGET_DIR, collect_objdiff=True, orig_entry=entry)
-                build(entry.object_path, entry.src_paths, "cpp", extra_flags="-DSKIP_ASM")
-            elif type(seg) == splat.segtypes.common.c.CommonSegC:
-                build(entry.object_path, entry.src_paths, "cc", out_dir=TARGET_DIR, collect_objdiff=True, orig_entry=entry)
-                build(entry.object_path, entry.src_paths, "cc", extra_flags="-DSKIP_ASM")
-            else:
-                print(f"ERROR: Unsupported build segment type {seg.type}")
-                sys.exit(1)
+            build(entry.object_path, str_srcs, entry.rule, orig_entry=entry)
 
     if objects_only:
         # Write objdiff.json if dual_objects (i.e. -diff)
@@ -327,17 +522,26 @@ def build_stuff(linker_entries: List[LinkerEntry], skip_checksum=False, objects_
                     "src/**/*.json"
                 ],
                 "units": objdiff_units,
-                "progress_categories": [ {"id": id, "name": name} for id, name in CATEGORY_MAP.items() ],
+                "progress_categories": PROGRESS_CATEGORIES,
             }
-            with open("objdiff.json", "w", encoding="utf-8") as f:
-                json.dump(objdiff, f, indent=2)
+
+            # The two files are independent, so write them side by side
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                futures = [
+                    executor.submit(write_if_changed, ROOT / "build.ninja", ninja_buffer.getvalue()),
+                    executor.submit(Path("objdiff.json").write_bytes, json_dumps(objdiff)),
+                ]
+                for future in futures:
+                    future.result()
+        else:
+            write_if_changed(ROOT / "build.ninja", ninja_buffer.getvalue())
         return
 
     ninja.build(
         PRE_ELF_PATH,
         "ld",
         LD_PATH,
-        implicit=[str(obj) for obj in built_objects],
+        implicit=built_objects,
         variables={"mapfile": MAP_PATH},
     )
 
@@ -357,14 +561,15 @@ def build_stuff(linker_entries: List[LinkerEntry], skip_checksum=False, objects_
     else:
         print("Skipping checksum step")
 
+    write_if_changed(ROOT / "build.ninja", ninja_buffer.getvalue())
+
 #MARK: Short loop fix
-# Pattern to workaround unintended nops around loops
-COMMENT_PART = r"\/\* (.+) ([0-9A-Z]{2})([0-9A-Z]{2})([0-9A-Z]{2})([0-9A-Z]{2}) \*\/"
-INSTRUCTION_PART = r"(\b(bne|bnel|beq|beql|beqz|bnez|bnezl|beqzl|bgez|bgezl|bgtz|bgtzl|blez|blezl|bltz|bltzl|b)\b.*)"
-OPCODE_PATTERN = re.compile(f"{COMMENT_PART}  {INSTRUCTION_PART}")
+# Pattern to workaround unintended nops around loops, matched one line at a time
+BRANCH_MNEMONICS = r"bne|bnel|beq|beql|beqz|bnez|bnezl|beqzl|bgez|bgezl|bgtz|bgtzl|blez|blezl|bltz|bltzl|b"
+OPCODE_PATTERN = re.compile(rf"\/\* (.+) ([0-9A-Z]{{8}}) \*\/  (\b(?:{BRANCH_MNEMONICS})\b.*)")
 
-PROBLEMATIC_FUNCS = set(
-    [
+PROBLEMATIC_FUNCS = frozenset(
+    {
         # text.cpp
         "func_00107760",
         "func_00107D68",
@@ -473,34 +678,68 @@ PROBLEMATIC_FUNCS = set(
         "func_00344A50",
 
         
-    ]
+    }
 )
 
+def replace_opcodes_in_file(path: Path) -> None:
+    """
+    Replace the branch instructions of a single assembly file with raw opcodes.
+    """
+    lines = path.read_text().split("\n")
+    replaced = False
+
+    for idx, line in enumerate(lines):
+        # Every branch mnemonic starts with a "b", which rules out most lines cheaply
+        if "*/  b" not in line:
+            continue
+
+        match = OPCODE_PATTERN.search(line)
+        if match is None:
+            continue
+
+        # Embed the opcode, we have to swap byte order for correct endianness
+        opcode = match[2]
+        lines[idx] = (
+            f"{line[:match.start()]}/* {match[1]} {opcode} */  "
+            f".word      0x{opcode[6:8]}{opcode[4:6]}{opcode[2:4]}{opcode[0:2]} /* {match[3]} */"
+        )
+        replaced = True
+
+    # Only write the file back if a reference was found
+    if replaced:
+        path.write_text("\n".join(lines))
+
+def find_problematic_asm(folder: Path):
+    """
+    Yield the assembly files of the problematic functions anywhere under a folder.
+    """
+    # scandir gives the entry types without a stat call and lets the names be
+    # checked before building a Path for each file
+    folders = [folder]
+    while folders:
+        with os.scandir(folders.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                elif entry.name.endswith(".s") and entry.name[:-2] in PROBLEMATIC_FUNCS:
+                    yield Path(entry.path)
+
 def replace_instructions_with_opcodes(asm_folder: Path) -> None:
     """
     Replace branch instructions with raw opcodes for functions that trigger the short loop bug.
     """
     nm_folder = ROOT / asm_folder / "nonmatchings"
 
-    for p in nm_folder.rglob("*.s"):
-        if p.stem not in PROBLEMATIC_FUNCS:
-            continue
-
-        with p.open("r") as file:
-            content = file.read()
+    if not nm_folder.is_dir():
+        return
 
-        if re.search(OPCODE_PATTERN, content):
-            # Reference found
-            # Embed the opcode, we have to swap byte order for correct endianness
-            content = re.sub(
-                OPCODE_PATTERN,
-                r"/* \1 \2\3\4\5 */  .word      0x\5\4\3\2 /* \6 */",
-                content,
-            )
+    paths = list(find_problematic_asm(nm_folder))
+    if not paths:
+        return
 
-            # Write the updated content back to the file
-            with p.open("w") as file:
-                file.write(content)
+    # The files are independent of each other, so rewrite them in parallel
+    with ProcessPoolExecutor() as executor:
+        list(executor.map(replace_opcodes_in_file, paths, chunksize=8))
 
 def main():
     parser = argparse.ArgumentParser(description="Configure the project")
@@ -539,16 +778,19 @@ def main():
         if args.clean_only:
             return
 
-    split.main([YAML_FILE], modes="all", verbose=False)
+    linker_entries, asm_path, split_cache_file = run_split()
+    start_wineserver()
 
-    linker_entries = split.linker_writer.entries
-    
     if do_objects:
         build_stuff(linker_entries, skip_checksum=True, objects_only=True, dual_objects=True)
     else:
         build_stuff(linker_entries, do_skip_checksum)
         
-    replace_instructions_with_opcodes(split.config["options"]["asm_path"])
+    replace_instructions_with_opcodes(asm_path)
+
+    # Only cache the split once everything that depends on it has finished
+    if split_cache_file is not None:
+        save_split_cache(split_cache_file, linker_entries, asm_path)
     
 
 if __name__ == "__main__":